@@ -1,4 +1,4 @@
-from distutils.core import setup
+from setuptools import setup
 
 setup(
     name = 'snek-framework',
@@ -11,18 +11,26 @@ setup(
     url = 'https://github.com/matteocargnelutti/snek',
     download_url = 'https://github.com/matteocargnelutti/snek/raw/master/dist/snek-0.1.1.tar.gz',
     keywords = ['framework', 'static-site generator', 'web'],
+    python_requires='>=3.8',
     install_requires=[
         'libsass',
         'mako',
         'python-frontmatter',
         'markdown'
     ],
+    extras_require={
+        'fast': ['orjson']
+    },
     classifiers=[
         'Development Status :: 3 - Alpha',
         'Intended Audience :: Developers',
         'Topic :: Software Development',
         'License :: OSI Approved :: Apache Software License',
-        'Programming Language :: Python :: 3.7',
-        'Programming Language :: Python :: 3.8'
+        'Programming Language :: Python :: 3.8',
+        'Programming Language :: Python :: 3.9',
+        'Programming Language :: Python :: 3.10',
+        'Programming Language :: Python :: 3.11',
+        'Programming Language :: Python :: 3.12',
+        'Programming Language :: Python :: 3.13'
     ],
 )
\ No newline at end of file
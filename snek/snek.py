@@ -5,21 +5,93 @@ snek.snek.py Module: Main Snek class
 # Imports
 #-------------------------------------------------------------------------------
 import os
+import re
+import sys
 import json
-import glob
+import hashlib
+import time
 import datetime
-from shutil import rmtree
-from distutils.dir_util import copy_tree
+import threading
+import multiprocessing
+from contextlib import nullcontext
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from shutil import rmtree, copytree, copy2
 
 import markdown
 import sass
 import frontmatter
 from frontmatter.default_handlers import JSONHandler as frontmatter_json_handler
-from mako.template import Template 
 from mako.lookup import TemplateLookup
+from mako import exceptions as mako_exceptions
+
+# Optional: orjson parses JSON faster than the standard library, and is used if installed.
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 from snek.snekconfig import SnekConfig
 
+#-------------------------------------------------------------------------------
+# JSON parsing
+#-------------------------------------------------------------------------------
+def json_loads(text):
+    """
+    Parses JSON with orjson if installed, with the standard library otherwise, so that the same files give the same results either way:
+    - orjson rejects NaN and Infinity: what it rejects is given to the standard library.
+    - orjson turns integers beyond 64 bits into floats: text containing 19 digits in a row is given to the standard library.
+
+    Parameters
+    ----------
+    text: bytes
+        UTF-8 encoded JSON.
+
+    Returns
+    -------
+    Parsed JSON.
+    """
+    if orjson is not None and not LONG_DIGITS_PATTERN.search(text):
+        try:
+            return orjson.loads(text)
+        except orjson.JSONDecodeError:
+            pass
+
+    return json.loads(text)
+
+#-------------------------------------------------------------------------------
+# Front matter handler
+#-------------------------------------------------------------------------------
+class FrontmatterJSONHandler(frontmatter_json_handler):
+    """
+    python-frontmatter's JSON handler, parsing front matter with orjson when available.
+    """
+
+    def load(self, fm, **kwargs):
+        """
+        Parses front matter.
+
+        Parameters
+        ----------
+        fm: str
+            JSON front matter.
+
+        Returns
+        -------
+        dict
+        """
+        if kwargs:
+            return json.loads(fm, **kwargs)
+
+        return json_loads(fm.encode('utf-8'))
+
+#-------------------------------------------------------------------------------
+# Constants
+#-------------------------------------------------------------------------------
+FRONTMATTER_HANDLER = FrontmatterJSONHandler() # Stateless: shared by all the content files
+IGNORED_FOLDERS = frozenset({'node_modules', '__pycache__'}) # Never walked when looking for data, content or templates files
+INODE_SORT_THRESHOLD = 256 # Folders with more entries than this are walked in inode order
+LONG_DIGITS_PATTERN = re.compile(rb'[0-9]{19}') # Integers this long may not fit in 64 bits (see json_loads)
+
 #-------------------------------------------------------------------------------
 # Main Snek class
 #-------------------------------------------------------------------------------
@@ -38,10 +110,18 @@ class Snek:
         Content tree with meta data, parsed from the project's content folder (see config).
     sitemap_flat: list
         Simple list of filepaths from the project's content folder (see config).
+    posts: dict
+        Parsed content files (frontmatter.Post), indexed by filepath. Used by build() so content files are only read once.
+    posts_mtime: dict
+        Modification time of each content file when it was parsed, indexed by filepath. Files edited since are parsed again by build().
     templates: list
         List of template files coming from the projects templates folder (see config).
     templates_default: str
         Path to the default template.
+    templates_mtime: float
+        Last modification time of the templates and of their folders. Adding, removing or renaming a file updates the modification time of its folder.
+    templates_relpaths: set
+        Paths of the templates, relative to the templates folder (see config). Ex: 'folder/template.html'
     build_start: datetime.datetime
         Indicates when the build started
     build_end: datetime.datetime
@@ -50,8 +130,18 @@ class Snek:
         Indicates how many pages were built
     pages_skipped: int
         Indicates how many pages were skipped (errors)
+    pages_unchanged: int
+        Indicates how many pages were not rebuilt, as they did not change (see config.incremental_build)
+    data_mtime: float
+        Last modification time of the data files and of their folders, when data was loaded.
+    data_fingerprint: frozenset
+        Data files and their modification time (ns), as tuples, when data was loaded. If data files were added, removed or edited since, build() loads them again.
+    sitemap_mtime: float
+        Last modification time of the content folders, when the sitemap was loaded: it changes when content files are added, removed or renamed.
     errors: list
-        Collects build errors.
+        Collects build errors, as tuples (time.monotonic(), message). See get_build_report() for their date.
+    clock_reference: tuple (datetime.datetime, float)
+        Date and time.monotonic() captured together at instanciation, used to date errors.
 
     Usage
     -----
@@ -74,15 +164,24 @@ class Snek:
         """
         # Base attributes
         self.errors = []
+        self.clock_reference = (datetime.datetime.now(), time.monotonic())
         self.build_start = None
         self.build_end = None
         self.pages_built = 0
         self.pages_skipped = 0
+        self.pages_unchanged = 0
         self.data = {}
+        self.data_mtime = 0
+        self.data_fingerprint = frozenset()
         self.sitemap = {}
+        self.sitemap_mtime = 0
         self.sitemap_flat = []
+        self.posts = {}
+        self.posts_mtime = {}
         self.templates = []
         self.templates_default = None
+        self.templates_relpaths = set()
+        self.templates_mtime = 0
         self.config = None
 
         #
@@ -124,12 +223,101 @@ class Snek:
 
         Returns
         -------
-        tuple (datetime, message)
+        tuple (monotonic time, message)
         """
-        now = datetime.datetime.now()
+        now = time.monotonic() # Cheaper than a datetime: dated by get_build_report()
         self.errors.append((now, message))
         return (now, message)
 
+    def __find_files(self, base_path, suffix, folders_found=None):
+        """
+        Recursively yields files from a folder whose name ends with a given suffix.
+        Walks the folder with os.scandir, which reuses the file type information of each directory entry.
+        Sub-folders are kept on a stack rather than walked recursively, so depth costs neither nested generators nor recursion limit.
+
+        Notes
+        -----
+        - Like glob.glob, hidden files and folders are ignored and a missing or unreadable folder, or a file given as a folder, has no files
+        - Folders listed in IGNORED_FOLDERS are not walked
+        - Symbolic links to folders are not followed
+
+        Parameters
+        ----------
+        base_path: str
+            Folder to look into.
+        suffix: str
+            Suffix to filter files with. Ex: '.json'
+        folders_found: list (optional)
+            If provided, the folders that were walked are appended to it.
+
+        Returns
+        -------
+        generator (str)
+        """
+        folders = [base_path]
+
+        while folders:
+            # List the whole folder first: its handle is closed before files are yielded
+            try:
+                folder_path = folders.pop()
+
+                with os.scandir(folder_path) as folder:
+                    entries = list(folder)
+            except (FileNotFoundError, NotADirectoryError, PermissionError):
+                continue
+
+            if folders_found is not None:
+                folders_found.append(folder_path)
+
+            # In large folders, visit entries in inode order so disk reads of their metadata are closer to each other.
+            # Inodes come with directory entries on POSIX, but cost a system call each on Windows.
+            if len(entries) > INODE_SORT_THRESHOLD and os.name == 'posix':
+                entries.sort(key=lambda entry: entry.inode())
+
+            for entry in entries:
+
+                if entry.name.startswith('.'):
+                    continue
+
+                if entry.is_dir(follow_symlinks=False):
+                    if entry.name not in IGNORED_FOLDERS:
+                        folders.append(entry.path)
+                elif entry.name.endswith(suffix) and entry.is_file():
+                    yield entry.path
+
+    def __copy_folder(self, source_path, destination_path):
+        """
+        Recursively copies a folder into another one, which is created if needed.
+        Folders are created by shutil.copytree, files are copied by a pool of threads so disk writes overlap.
+
+        If config.incremental_build is True, files that did not change since their last copy are not copied again.
+
+        Parameters
+        ----------
+        source_path: str
+            Folder to copy.
+        destination_path: str
+            Folder to copy into. Existing files are replaced.
+
+        Returns
+        -------
+        bool
+        """
+        only_if_changed = self.config.incremental_build
+
+        with ThreadPoolExecutor(max_workers=min(32, (os.cpu_count() or 1) * 4)) as executor:
+            copies = []
+
+            # copytree creates each folder before handing its files to copy_function, which only queues them
+            copytree(source_path, destination_path, dirs_exist_ok=True,
+                     copy_function=lambda source, destination: copies.append(executor.submit(_copy_file, source, destination, only_if_changed)))
+
+            # Raise the first copy error, if any
+            for copy in copies:
+                copy.result()
+
+        return True
+
     def __load_data(self):
         """
         Loads data to be shared accross templates into self.data.
@@ -142,47 +330,40 @@ class Snek:
         -------
         bool
         """
-        # Collect all json files from the data folder
-        data_filepaths = glob.glob(f"{self.config.data_path}/**/*.json", recursive=True)
-
         # Clear self.data
         self.data = {}
 
+        # List data files and keep track of their state, to detect changes (see build()).
+        # Taken before reading: an edit made while reading will be seen as a change.
+        data_folders = []
+        data_filepaths = list(self.__find_files(self.config.data_path, '.json', data_folders))
+        self.data_fingerprint = _fingerprint(data_filepaths)
+        self.data_mtime = _latest_mtime(data_filepaths + data_folders)
+
+        # Data folder prefix, to be removed from each filepath
+        data_path_prefix = f"{self.config.data_path}{os.sep}"
+
         # For each file:
         # - Load and parse content content
         # - Create an entry in self.data that matches their position inside the data folder
         for filepath in data_filepaths:
 
             try:
-                # Read and parse content
-                data_piece = open(filepath).read()
-                data_piece = json.loads(data_piece)
+                # Read and parse content, from bytes
+                with open(filepath, 'rb') as data_file:
+                    data_piece = json_loads(data_file.read())
 
-                # Remove the data folder from filepath and split it into components
-                filepath = filepath.replace(f"{self.config.data_path}/", '')
-                filepath_components = filepath.split(os.sep)
+                # Remove the data folder and extension from filepath and split it into components
+                filepath_components = filepath[len(data_path_prefix):-len('.json')].split(os.sep)
 
-                # Iterate through the filepath components to add this data to a place in self.data,
-                # so it matches its position in the data folder.
+                # Place this data where it is in the data folder.
                 # Ex: if ./data/folder1/folder2/file.json > self.data['folder1']['folder2']['file']
-                branch = self.data # branch iterator through self.data
-                for component in filepath_components:
-
-                    # If we have reached the file, clean its name and add content to self.data
-                    if component == filepath_components[-1]:
-                        key = component.replace('.json', '')
-                        branch[key] = data_piece
-                        break
-
-                    # If we have reached a directory and it does not exist a key for it in self.data, create it.
-                    if component not in branch.keys():
-                        branch[component] = {}
-
-                    # Update branch iterator so we are one level deeper in self.data
-                    branch = branch[component]
+                # If the data of another file is in the way (ex: a list in "folder1.json"), report it.
+                if not _insert_at_path(self.data, filepath_components, data_piece):
+                    self.__add_error(f"{filepath} was not added to data: its path is already used by another data file.")
 
             # If the file could not be read or open
-            except FileNotFoundError:
+            except (FileNotFoundError, PermissionError):
                 self.__add_error(f"{filepath} cannot be read.")
             # If the file's content is not valid JSON
             except json.decoder.JSONDecodeError as err:
@@ -197,29 +378,31 @@ class Snek:
         bool
         """
         # Load all template files
-        self.templates = glob.glob(f"{self.config.templates_path}/**/*.html", recursive=True)
+        templates_folders = []
+        self.templates = list(self.__find_files(self.config.templates_path, '.html', templates_folders))
 
-        # Check if the default is available
-        has_default_template = False
+        # Keep their path relative to the templates folder, to match the "template" field of content files
+        self.templates_relpaths = {os.path.relpath(template, self.config.templates_path).replace(os.sep, '/')
+                                   for template in self.templates}
 
-        for template in self.templates: # Look for a "index.html" at the root of the templates folder
-            template_check = template.replace(self.config.templates_path, '')
-            template_check = template_check.replace('/', '')
-            template_check = template_check.replace('\\', '')
+        # Check if the default is available: a "index.html" at the root of the templates folder
+        default_template = os.path.join(self.config.templates_path, 'index.html')
 
-            if template_check == 'index.html':
-                has_default_template = True
-                self.templates_default = template # Remember the default template
-
-        if not has_default_template:
+        if not os.path.isfile(default_template):
             raise NoDefaultTemplate
 
+        self.templates_default = default_template # Remember the default template
+
+        # Templates can include each other: any edit, addition or removal may impact every page, for incremental builds
+        self.templates_mtime = _latest_mtime(self.templates + templates_folders)
+
         # If we land here, there is at least the default template.
         return True
 
     def __load_sitemap(self):
         """
-        List all content files and load their metadata in self.sitemap and self.sitemap_flat
+        List all content files and load their metadata in self.sitemap and self.sitemap_flat (sorted).
+        Parsed content files are kept in self.posts, for build() to use.
 
         Returns
         -------
@@ -228,69 +411,72 @@ class Snek:
         # Clear sitemap
         self.sitemap = {}
         self.sitemap_flat = []
+        self.posts = {}
+        self.posts_mtime = {}
+
+        # Content folder prefix, to be removed from each filepath
+        content_path_prefix = f"{self.config.content_path}{os.sep}"
+
+        # Content folders, filled as they are walked
+        content_folders = []
 
         # For each content file:
-        # - Read and parse meta data
-        # - Add to the sitemap tree in a way that matches the content folder structure.
-        for filepath in glob.glob(f"{self.config.content_path}/**/*.json.md", recursive=True):
-
-            # Add entry to sitemap_flat
-            self.sitemap_flat.append(filepath)
-
-            #
-            # Prepare meta data
-            #
-
-            # Defaults
-            metadata = {
-                'filepath': filepath,
-                'title': '',
-                'template': None,
-                'category': None,
-                'tags': [],
-                'date': None
-            }
-
-            # Load from front-matter and add to default
-            try:
-                metadata_from_file = frontmatter.load(filepath, handler=frontmatter_json_handler()).metadata
-                for key, value in metadata_from_file.items():
-                    metadata[key] = value
+        # - Read and parse it. Files are read by a pool of threads, so disk reads overlap.
+        # - Add its meta data to the sitemap tree in a way that matches the content folder structure.
+        with ThreadPoolExecutor(max_workers=min(32, (os.cpu_count() or 1) * 4)) as executor:
 
-            # If the file could not be read or open, go to next file
-            except FileNotFoundError:
-                self.__add_error(f"{filepath} cannot be read.")
-                continue
-            # If the file's content is not valid JSON frontmatter, simply log it
-            except json.decoder.JSONDecodeError as err:
-                self.__add_error(f"{filepath} does not contain valid JSON. {err}")
+            for filepath, post, mtime, error in executor.map(_load_post, self.__find_files(self.config.content_path, '.json.md', content_folders)):
+
+                # Add entry to sitemap_flat
+                self.sitemap_flat.append(filepath)
+
+                #
+                # Prepare meta data
+                #
 
-            #
-            # Add item and meta data to sitemap tree
-            #
+                # Defaults
+                metadata = {
+                    'filepath': filepath,
+                    'title': '',
+                    'template': None,
+                    'category': None,
+                    'tags': [],
+                    'date': None
+                }
+
+                # If the file could not be read or open, go to next file
+                if isinstance(error, (FileNotFoundError, PermissionError)):
+                    self.__add_error(f"{filepath} cannot be read.")
+                    continue
+                # If the file's content is not valid JSON frontmatter, simply log it
+                elif error is not None:
+                    self.__add_error(f"{filepath} does not contain valid JSON. {error}")
+                # Add front-matter to default. Keep the parsed file for build().
+                else:
+                    for key, value in post.metadata.items():
+                        metadata[key] = value
+
+                    self.posts[filepath] = post
+                    self.posts_mtime[filepath] = mtime
 
-            # Remove the content folder from filepath and split it into componetns
-            filepath = filepath.replace(f"{self.config.content_path}/", '')
-            filepath_components = filepath.split(os.sep)
+                #
+                # Add item and meta data to sitemap tree
+                #
 
-            # Iterate through the filepath components to add this data to a place in self.data,
-            # so it matches its position in the data folder.
-            # Ex: if ./content/folder1/folder2/file.json > self.sitemap['folder1']['folder2']['file']
-            branch = self.sitemap # branch iterator through self.data
-            for component in filepath_components:
+                # Remove the content folder and extension from filepath and split it into components
+                filepath_components = filepath[len(content_path_prefix):-len('.json.md')].split(os.sep)
 
-                # If we have reached the file, clean its name and add content to self.data
-                if component == filepath_components[-1]:
-                    key = component.replace('.json.md', '')
-                    branch[key] = metadata
-                    break
+                # Place this entry where it is in the content folder.
+                # Ex: if ./content/folder1/folder2/file.json.md > self.sitemap['folder1']['folder2']['file']
+                # If another entry is in the way, report it. The page is still built.
+                if not _insert_at_path(self.sitemap, filepath_components, metadata):
+                    self.__add_error(f"{filepath} was not added to the sitemap: its path is already used by another content file.")
 
-                # If we have reached a directory and it does not exist a key for it in self.data, create it.
-                if component not in branch.keys():
-                    branch[component] = {}
+        # Sort content files, so pages from the same folder are built next to each other
+        self.sitemap_flat.sort()
 
-                # Update branch iterator so we are one level deeper in self.data
-                branch = branch[component]
+        # Every page receives the sitemap: adding, removing or renaming a content file may impact all of them, for incremental builds
+        self.sitemap_mtime = _latest_mtime(content_folders)
 
         return True
 
@@ -308,8 +494,12 @@ class Snek:
         # Timer start
         self.pages_built = 0
         self.pages_skipped = 0
+        self.pages_unchanged = 0
         self.build_start = datetime.datetime.now()
 
+        # Data and templates may have been edited since they were loaded
+        self.__reload_changed_sources()
+
         # Build assets files and JavaScript
         self.__build_assets()
         self.__build_js()
@@ -333,26 +523,53 @@ class Snek:
 
         return True
 
+    def __reload_changed_sources(self):
+        """
+        Takes into account changes made to data and template files since they were loaded, so pages are not built from outdated sources.
+        - Data is loaded again if a data file was added, removed or edited. This discards changes made to self.data programmatically.
+        - Templates are listed again: they are read by the workers when rendering.
+        Content files are checked one by one by __build_content().
+
+        Returns
+        -------
+        bool
+        """
+        if _fingerprint(self.__find_files(self.config.data_path, '.json')) != self.data_fingerprint:
+            self.__load_data()
+
+        self.__load_templates()
+
+        return True
+
     def get_build_report(self):
         """
         Returns stats as a dict.
+        Errors are returned as tuples (datetime, message).
 
         Returns
         -------
         dict
         """
+        # Date errors, from their distance to the clock reference
+        reference_datetime, reference_monotonic = self.clock_reference
+        errors = [(reference_datetime + datetime.timedelta(seconds=moment - reference_monotonic), message)
+                  for moment, message in self.errors]
+
         return {
             'build_start': self.build_start,
             'build_end': self.build_end,
             'build_time': self.build_end - self.build_start,
             'pages_built': self.pages_built,
             'pages_skipped': self.pages_skipped,
-            'errors': self.errors
+            'pages_unchanged': self.pages_unchanged,
+            'errors': errors
         }
 
     def __build_content(self):
         """
         Processes content files: generates HTML by running them through their associated template.
+        Pages are rendered in parallel, by a pool of processes on Linux (threads on other platforms, or if config.build_in_threads is True).
+        The number of workers is set by config.build_workers.
 
         Templates have access to the following variables:
         -------------------------------------------------
@@ -362,68 +579,164 @@ class Snek:
         - sitemap: complete sitemap
         - config: current configuration as a dict
 
+        If a content file has a "template" field matching a file of the templates folder, it is used instead of the default template.
+
+        Content files edited since they were parsed are parsed again. The sitemap keeps their metadata from the initial parsing.
+
+        If config.incremental_build is True, pages whose HTML file is more recent than their content file,
+        the templates, the data files and the content folders (see self.sitemap_mtime) are not rebuilt.
+
         Returns
         -------
         bool
         """
-        # For each content file
+        # Everything the workers need to render a page, shared across pages
+        context = {
+            'data': self.data,
+            'sitemap': self.sitemap,
+            'config': self.config.to_dict()
+        }
+
+        # Pages to render: (source_filepath, destination_filepath, template_uri, metadata, content),
+        # from the files parsed by __load_sitemap
+        pages = []
+
+        # Values used for every page, looked up once
+        posts = self.posts
+        posts_mtime = self.posts_mtime
+        templates_relpaths = self.templates_relpaths
+        content_path = self.config.content_path
+        build_path = self.config.build_path
+        incremental_build = self.config.incremental_build
+        shared_sources_mtime = max(self.templates_mtime, self.data_mtime, self.sitemap_mtime) # Templates, data and sitemap are used by every page
+
         for source_filepath in self.sitemap_flat:
 
+            # If the content file changed since it was parsed, parse it again
             try:
-                # Read and parse content
-                page = frontmatter.load(source_filepath, handler=frontmatter_json_handler())
+                source_mtime = os.path.getmtime(source_filepath)
+            except (FileNotFoundError, PermissionError):
+                source_mtime = None
 
-                # In the content filepath, replace content source folder by build folder, and replace ext .md.json by .html
-                destination_filepath = source_filepath.replace(self.config.content_path, self.config.build_path)
-                destination_filepath = destination_filepath.replace('.json.md', '.html')
+            if source_mtime is None or source_mtime != posts_mtime.get(source_filepath):
+                _, post, mtime, error = _load_post(source_filepath)
 
-                # Determine which template should be used.
-                # If content has a "template" field, check it is valid and use it.
-                template_filepath = self.templates_default
+                if error is None:
+                    posts[source_filepath] = post
+                    posts_mtime[source_filepath] = mtime
+                else:
+                    posts.pop(source_filepath, None)
+                    posts_mtime.pop(source_filepath, None)
 
-                if 'template' in page.metadata and page.metadata['template']:
+            # If the file could not be parsed, skip it
+            post = posts.get(source_filepath)
 
-                    # Append the template folder to the provided template value
-                    wanted_template = f"{self.config.templates_path}/{page.metadata['template']}"
+            if post is None:
+                self.pages_skipped += 1
+                self.__add_error(f"{source_filepath} was skipped: its front matter could not be parsed.")
+                continue
 
-                    # And check if it exists
-                    if os.path.exists(wanted_template):
-                        template_filepath = wanted_template
+            # Determine which template should be used, as a path from the root of the templates folder.
+            # If content has a "template" field, check it is a known template and use it.
+            template_uri = '/index.html'
+            template = post.metadata.get('template')
+
+            if template and isinstance(template, str):
+                template = os.path.normpath(template).replace(os.sep, '/').lstrip('/') # "/folder/template.html" is accepted too
+
+                if template in templates_relpaths:
+                    template_uri = f'/{template}'
+
+            # In the content filepath, replace content source folder by build folder, and replace ext .json.md by .html.
+            # Both are sliced off: content files are listed from the content folder and end with .json.md.
+            destination_filepath = f"{build_path}{source_filepath[len(content_path):-len('.json.md')]}.html"
+
+            # Incremental build: skip pages whose HTML file is more recent than everything they are built from
+            if incremental_build and os.path.exists(destination_filepath):
+                sources_mtime = max(posts_mtime[source_filepath], shared_sources_mtime)
+
+                if os.path.getmtime(destination_filepath) > sources_mtime:
+                    self.pages_unchanged += 1
+                    continue
+
+            pages.append((source_filepath, destination_filepath, template_uri, post.metadata, post.content))
+
+        # Nothing to render
+        if not pages:
+            return True
+
+        # Where compiled templates are kept between builds, if anywhere
+        templates_cache_path = self.__get_templates_cache_path()
+
+        # Create destination folders once, before rendering, so workers don't have to check for them
+        for destination_dirname in {os.path.dirname(page[1]) for page in pages}:
+            os.makedirs(destination_dirname, exist_ok=True)
+
+        # As many workers as config allows (one per CPU by default), but not more than there are pages
+        workers = min(self.config.build_workers or os.cpu_count() or 1, len(pages))
+
+        # Pick where to render:
+        # - A single worker renders in the current thread: a pool would only add overhead.
+        # - Processes by default on Linux, as rendering is CPU-bound. "fork" is required so the building script is not re-executed by workers.
+        #   Pages are sent to processes in batches, to limit inter-process round trips.
+        # - Threads if asked to in config, or on other platforms: "fork" is unsafe on macOS and unavailable on Windows.
+        if workers == 1:
+            executor = None
+            _init_render_worker(context, templates_cache_path)
+            results = map(_render_page, pages)
+        elif self.config.build_in_threads or not sys.platform.startswith('linux'):
+            executor = ThreadPoolExecutor(max_workers=workers,
+                                          initializer=_init_render_worker,
+                                          initargs=(context, templates_cache_path))
+            results = executor.map(_render_page, pages)
+        else:
+            executor = ProcessPoolExecutor(max_workers=workers,
+                                           mp_context=multiprocessing.get_context('fork'),
+                                           initializer=_init_render_worker,
+                                           initargs=(context, templates_cache_path))
+            results = executor.map(_render_page, pages, chunksize=max(1, len(pages) // (workers * 4)))
+
+        # Collect results, in order
+        with executor or nullcontext():
+            for destination_filepath, error in results:
+
+                if error is None:
+                    self.pages_built += 1
+                else:
+                    self.pages_skipped += 1
+                    self.__add_error(error)
 
-                #
-                # Render content using template into HTML file
-                #
+        return True
 
-                # Parse markdown
-                page.content = markdown.markdown(page.content)
+    def __get_templates_cache_path(self):
+        """
+        Returns the folder where compiled templates are kept between builds, if config.cache_path is set.
 
-                # Render template
-                lookup = TemplateLookup(directories=[self.config.templates_path,]) # Used to make the template aware of its suroundings
-                renderer = Template(filename=template_filepath, lookup=lookup)
-                html = renderer.render(data=self.data,
-                                       sitemap=self.sitemap,
-                                       config=self.config.__dict__,
-                                       metadata=page.metadata,
-                                       content=page.content)
+        Compiled templates are named after their path in the templates folder, and Mako only compiles a template again
+        if it was edited after its compiled version was written, to the second: an edit made within the same second would go unnoticed.
+        The folder is therefore named after the location and content of the templates folder:
+        any edit to a template leads to a different folder, and projects or themes sharing a cache folder don't use each other's templates.
 
-                # Write HTML file
-                destination_dirname = os.path.dirname(destination_filepath)
-                if not os.path.exists(destination_dirname):
-                    os.makedirs(destination_dirname)
+        Returns
+        -------
+        str
+            None if there is no cache folder.
+        """
+        if self.config.cache_path is None:
+            return None
 
-                open(destination_filepath, 'w').write(html)
+        templates_hash = hashlib.sha1(os.path.abspath(self.config.templates_path).encode('utf-8'))
 
-                # Count as built
-                self.pages_built += 1
+        for template in sorted(self.templates):
+            try:
+                with open(template, 'rb') as template_file:
+                    templates_hash.update(template.encode('utf-8'))
+                    templates_hash.update(hashlib.sha1(template_file.read()).digest())
+            # Missing or unreadable templates are reported when rendering
+            except (FileNotFoundError, PermissionError):
+                pass
 
-            # If the file could not be read or open
-            except FileNotFoundError as err:
-                self.pages_skipped += 1
-                self.__add_error(err)
-            # If the file's content is not valid JSON
-            except json.decoder.JSONDecodeError as err:
-                self.pages_skipped += 1
-                self.__add_error(err)
+        return os.path.join(self.config.cache_path, 'mako', templates_hash.hexdigest()[:16])
 
     def __build_scss(self):
         """
@@ -451,7 +764,7 @@ class Snek:
         -------
         bool
         """
-        copy_tree(self.config.css_path, self.config.build_path + '/css')
+        self.__copy_folder(self.config.css_path, self.config.build_path + '/css')
         return True
 
     def __build_js(self):
@@ -462,7 +775,7 @@ class Snek:
         -------
         bool
         """
-        copy_tree(self.config.js_path, self.config.build_path + '/js')
+        self.__copy_folder(self.config.js_path, self.config.build_path + '/js')
         return True
 
     def __build_data(self):
@@ -474,7 +787,7 @@ class Snek:
         -------
         bool
         """
-        copy_tree(self.config.data_path, self.config.build_path + '/__data')
+        self.__copy_folder(self.config.data_path, self.config.build_path + '/__data')
         return True
 
     def __build_assets(self):
@@ -485,9 +798,246 @@ class Snek:
         -------
         bool
         """
-        copy_tree(self.config.assets_path, self.config.build_path + '/assets')
+        self.__copy_folder(self.config.assets_path, self.config.build_path + '/assets')
         return True
 
+#-------------------------------------------------------------------------------
+# Trees: used by Snek.__load_data and Snek.__load_sitemap
+#-------------------------------------------------------------------------------
+def _insert_at_path(tree, components, value):
+    """
+    Places a value in a tree of dicts, creating missing branches.
+    Ex: components ['folder1', 'folder2', 'file'] > tree['folder1']['folder2']['file'] = value
+
+    Existing dicts are used as branches: a "folder1" value that is a dict receives the "folder2" branch.
+    Nothing is replaced: if the key of the value is taken, or a value that is not a dict is in the way, the tree is left as is.
+
+    Parameters
+    ----------
+    tree: dict
+        Tree to insert into.
+    components: list
+        Keys of the branches to walk down, then key of the value.
+    value:
+        Value to insert.
+
+    Returns
+    -------
+    bool
+        False if the value could not be placed.
+    """
+    branch = tree
+
+    # Existing branches are looked up once. setdefault would allocate an empty dict for every level, even when it exists.
+    for component in components[:-1]:
+        next_branch = branch.get(component)
+
+        if next_branch is None:
+            next_branch = branch[component] = {}
+        elif not isinstance(next_branch, dict):
+            return False
+
+        branch = next_branch
+
+    if components[-1] in branch:
+        return False
+
+    branch[components[-1]] = value
+    return True
+
+#-------------------------------------------------------------------------------
+# Modification times: used to detect edits
+#-------------------------------------------------------------------------------
+def _latest_mtime(filepaths):
+    """
+    Returns the modification time of the most recently edited file or folder. Files that no longer exist are ignored.
+
+    Parameters
+    ----------
+    filepaths: iterable (str)
+
+    Returns
+    -------
+    float
+        0 if there is no file.
+    """
+    latest = 0
+
+    for filepath in filepaths:
+        try:
+            latest = max(latest, os.path.getmtime(filepath))
+        except FileNotFoundError:
+            pass
+
+    return latest
+
+def _fingerprint(filepaths):
+    """
+    Returns the state of a set of files, which changes if a file is added, removed or edited. Files that no longer exist are ignored.
+
+    Parameters
+    ----------
+    filepaths: iterable (str)
+
+    Returns
+    -------
+    frozenset
+        Tuples (filepath, modification time in nanoseconds).
+    """
+    fingerprint = set()
+
+    for filepath in filepaths:
+        try:
+            fingerprint.add((filepath, os.stat(filepath).st_mtime_ns))
+        except FileNotFoundError:
+            pass
+
+    return frozenset(fingerprint)
+
+#-------------------------------------------------------------------------------
+# Files copy: runs in the threads of Snek.__copy_folder
+#-------------------------------------------------------------------------------
+def _copy_file(source_filepath, destination_filepath, only_if_changed=False):
+    """
+    Copies a file, along with its modification time.
+
+    Parameters
+    ----------
+    source_filepath: str
+        Path to the file to copy.
+    destination_filepath: str
+        Path to copy the file to.
+    only_if_changed: bool (optional)
+        If True, the file is not copied if the destination has the same or a later modification time. (defaults to False)
+
+    Returns
+    -------
+    bool
+        False if the file was not copied as it did not change.
+    """
+    if only_if_changed:
+        try:
+            # copy2 keeps the modification time of the source: equal means unchanged since the last copy
+            if os.path.getmtime(destination_filepath) >= os.path.getmtime(source_filepath):
+                return False
+        except FileNotFoundError:
+            pass
+
+    copy2(source_filepath, destination_filepath)
+    return True
+
+#-------------------------------------------------------------------------------
+# Content loading: runs in the threads of Snek.__load_sitemap
+#-------------------------------------------------------------------------------
+def _load_post(filepath):
+    """
+    Reads and parses a content file.
+
+    Parameters
+    ----------
+    filepath: str
+        Path to the content file.
+
+    Returns
+    -------
+    tuple (filepath, post, mtime, error)
+        post is a frontmatter.Post, or None if the file could not be read or parsed (see error).
+        mtime is the modification time of the file before it was read.
+    """
+    try:
+        mtime = os.path.getmtime(filepath)
+        return (filepath, frontmatter.load(filepath, handler=FRONTMATTER_HANDLER), mtime, None)
+    except (FileNotFoundError, PermissionError, json.decoder.JSONDecodeError) as err:
+        return (filepath, None, None, err)
+
+#-------------------------------------------------------------------------------
+# Pages rendering: runs in the workers of Snek.__build_content
+#-------------------------------------------------------------------------------
+_worker = threading.local() # Holds the rendering state of the current worker (process or thread)
+
+def _init_render_worker(context, templates_cache_path=None):
+    """
+    Workers initializer: prepares the rendering state of the current worker.
+    Each worker gets its own templates lookup (which caches compiled templates) and Markdown parser.
+
+    Parameters
+    ----------
+    context: dict
+        data, sitemap and config (as a dict), shared by all the pages.
+    templates_cache_path: str (optional)
+        Folder where compiled templates are kept between builds (see Snek.__get_templates_cache_path). None: no cache.
+    """
+    # Template variables shared by all the pages, passed as-is to every render
+    state = {'context': context}
+
+    # Loads templates and makes them aware of their suroundings.
+    # Each template is only compiled once per worker, then kept in the lookup.
+    # If a cache folder is given, compiled templates are also written to it, so they are not compiled again on the next builds.
+    # Templates are only checked for changes when loaded for the first time by a worker.
+    # Rendered pages are encoded to UTF-8 by Mako, ready to be written.
+    state['template_lookup'] = TemplateLookup(directories=[context['config']['templates_path'],],
+                                              module_directory=templates_cache_path,
+                                              filesystem_checks=False,
+                                              input_encoding='utf-8',
+                                              output_encoding='utf-8',
+                                              encoding_errors='replace')
+
+    # Markdown parser, reset between pages instead of being re-created for each of them.
+    # Extensions are only loaded once per worker.
+    state['markdown'] = markdown.Markdown(extensions=context['config']['markdown_extensions'])
+
+    _worker.state = state
+
+def _render_page(page):
+    """
+    Renders a content file into an HTML file using its associated template.
+    Uses the rendering state of the current worker (see _init_render_worker).
+    The destination folder must already exist.
+
+    Parameters
+    ----------
+    page: tuple (source_filepath, destination_filepath, template_uri, metadata, content)
+        Path to the content file, to the HTML file to write, to the template to use (from the templates folder),
+        parsed front matter and markdown content of the content file.
+
+    Returns
+    -------
+    tuple (destination_filepath, error)
+        error is None if the page was built, or a message explaining why it was not.
+    """
+    state = _worker.state
+    template_lookup = state['template_lookup']
+    source_filepath, destination_filepath, template_uri, metadata, content = page
+
+    try:
+        #
+        # Render content using template into HTML file
+        #
+
+        # Parse markdown
+        content = state['markdown'].reset().convert(content)
+
+        # Render template, as UTF-8 bytes
+        renderer = template_lookup.get_template(template_uri)
+
+        html = renderer.render(metadata=metadata,
+                               content=content,
+                               **state['context'])
+
+        # Write HTML file. Destination folders are created by Snek.__build_content beforehand.
+        # Written as bytes in a single call: no newline translation by a text layer.
+        with open(destination_filepath, 'wb') as html_file:
+            html_file.write(html)
+
+    # If a file could not be read or written
+    except (FileNotFoundError, PermissionError) as err:
+        return (destination_filepath, f"{source_filepath} could not be built. {err}")
+    # Any other error, such as a template error. Returned as text: exceptions may not survive the trip back from a worker process.
+    except Exception:
+        return (destination_filepath, f"{source_filepath} could not be built. {mako_exceptions.text_error_template().render().strip()}")
+
+    return (destination_filepath, None)
+
 #-------------------------------------------------------------------------------
 # Custom snekceptions
 #-------------------------------------------------------------------------------
@@ -7,6 +7,11 @@ snek.snekconfig.py Module: Snek configuration object class
 import os
 import re
 
+#-------------------------------------------------------------------------------
+# Constants
+#-------------------------------------------------------------------------------
+PATH_PATTERN = re.compile('(\\\\?([^\\/]*[\\/])*)([^\\/]+)$') # Valid path format, compiled once
+
 #-------------------------------------------------------------------------------
 # SnekConfig class
 #-------------------------------------------------------------------------------
@@ -39,6 +44,17 @@ class SnekConfig:
         Path to the project's SASS files.
     scss_output_style: str
         Can be 'compressed' , 'nested' or 'expanded'.
+    markdown_extensions: list
+        Python-Markdown extensions to use when parsing content files. Ex: ['tables', 'fenced_code']
+    cache_path: str
+        Path to the folder where compiled templates are kept between builds. Will be created if needed. None means templates are compiled on every build.
+    build_in_threads: bool
+        If True, pages will be rendered by a pool of threads instead of a pool of processes. Threads are always used on platforms other than Linux.
+    build_workers: int
+        How many processes (or threads) render pages in parallel. None means one per CPU.
+    incremental_build: bool
+        If True, pages will only be rebuilt if their content file, the templates or the data files changed since their last build.
+        Assets, JavaScript, CSS and data files will only be copied if they changed.
     is_valid: bool
         Indicates if the current configuration is valid.
     """
@@ -54,7 +70,12 @@ class SnekConfig:
                  css_path='./css',
                  scss_active=True,
                  scss_path='./scss',
-                 scss_output_style='compressed'):
+                 scss_output_style='compressed',
+                 markdown_extensions=None,
+                 cache_path=None,
+                 build_in_threads=False,
+                 build_workers=None,
+                 incremental_build=False):
         """
         Constructor.
 
@@ -82,6 +103,16 @@ class SnekConfig:
             See self.scss_path. (defaults to './scss')
         scss_output_style: str (optional)
             See self.scss_output_style. (defaults to 'compressed')
+        markdown_extensions: list (optional)
+            See self.markdown_extensions. (defaults to None: no extensions)
+        cache_path: str (optional)
+            See self.cache_path. (defaults to None: no cache)
+        build_in_threads: bool (optional)
+            See self.build_in_threads. (defaults to False)
+        build_workers: int (optional)
+            See self.build_workers. (defaults to None: one per CPU)
+        incremental_build: bool (optional)
+            See self.incremental_build. (defaults to False)
 
         Returns
         -------
@@ -116,10 +147,16 @@ class SnekConfig:
             'css_path': css_path
         }
 
+        # The cache folder is optional
+        if cache_path is not None:
+            paths_to_check['cache_path'] = cache_path
+        else:
+            self.cache_path = None
+
         # Check that folders exist and keep as attributes
         for what, where in paths_to_check.items():
 
-            if not re.match('(\\\\?([^\\/]*[\\/])*)([^\\/]+)$', where):
+            if not PATH_PATTERN.match(where):
                 raise InvalidPath(f"Invalid path provided for the {what} folder. '{where}' given.")
 
             where = os.path.normpath(where)
@@ -131,6 +168,10 @@ class SnekConfig:
         self.scss_active = True if scss_active == True else False
         self.scss_output_style = scss_output_style if scss_output_style in ['compressed', 'nested', 'expanded'] else 'compressed'
         self.data_in_build = True if data_in_build == True else False
+        self.markdown_extensions = list(markdown_extensions) if isinstance(markdown_extensions, (list, tuple)) else []
+        self.build_in_threads = True if build_in_threads == True else False
+        self.build_workers = build_workers if type(build_workers) is int and build_workers > 0 else None
+        self.incremental_build = True if incremental_build == True else False
 
         #
         # If we reach this point, the configuration is valid
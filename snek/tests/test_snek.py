@@ -5,7 +5,9 @@ snek.tests.test_snek.py Module: Basic tests for Snek.
 # Imports
 #-------------------------------------------------------------------------------
 import os
-from shutil import rmtree
+import time
+import datetime
+from shutil import rmtree, copytree
 
 import pytest
 
@@ -27,7 +29,12 @@ CONFIG_ARGUMENTS = {
     'css_path': f'{MOCKS_FOLDER}/css',
     'scss_active': True,
     'scss_path': f'{MOCKS_FOLDER}/scss',
-    'scss_output_style': 'compressed'
+    'scss_output_style': 'compressed',
+    'markdown_extensions': ['tables'],
+    'cache_path': f'{MOCKS_FOLDER}/cache',
+    'build_in_threads': False,
+    'build_workers': 2,
+    'incremental_build': False
 }
 
 #-------------------------------------------------------------------------------
@@ -61,13 +68,17 @@ def test_build_with_scss():
     ------------------
     - Data is accessible programmatically and can be edited
     - Sitemap is accessible programmatically
+    - Pages are built from the content files parsed with the sitemap, which are not read twice
     - Pages are built based on content, selected template, and can access shared data.
+    - Markdown extensions from config are used
     - SCSS is processed
     - assets files are copied
     - JS files are copies
     - Build report is accessible
     - The "data_in_build" option works, making shared data available as JSON in the build folder.
     - Simple CSS copy works when "scss_active" option is False
+    - Pages can be rendered by a pool of threads when "build_in_threads" option is True
+    - Only pages whose sources changed are rebuilt when "incremental_build" option is True
     """
     # Cleanup
     rmtree(CONFIG_ARGUMENTS['build_path'])
@@ -119,6 +130,11 @@ def test_build_with_scss():
     assert website.sitemap_flat
     assert len(website.sitemap_flat) == 4
 
+    # Parsed content files, used by build() instead of reading them again
+    assert len(website.posts) == 4
+    for filepath in website.sitemap_flat:
+        assert website.posts[filepath]
+
     #
     # Build
     #
@@ -143,6 +159,34 @@ def test_build_with_scss():
     assert test1_html_content.find('ALTERNATIVE TEMPLATE') == -1
     assert test2_html_content.find('ALTERNATIVE TEMPLATE')
 
+    # test3.json.md contains a table: the "tables" markdown extension is used
+    test3_html_content = open(f"{CONFIG_ARGUMENTS['build_path']}/subfolder/subsubfolder/test3.html", 'r').read()
+    assert test3_html_content.find('<table>') != -1
+
+    #
+    # Test: Pages are built from the content files parsed with the sitemap, which are not read twice
+    #
+    test1_filepath = f"{website.config.content_path}/test1.json.md"
+    test1_content = website.posts[test1_filepath].content
+
+    website.posts[test1_filepath].content = 'Edited in memory.'
+    website.build()
+    assert open(f"{CONFIG_ARGUMENTS['build_path']}/test1.html", 'r').read().find('Edited in memory.') != -1
+
+    website.posts[test1_filepath].content = test1_content
+
+    # "template" can start with a slash, and falls back to the default template if it is not a string
+    website.posts[test1_filepath].metadata['template'] = '/alternate.html'
+    website.build()
+    assert open(f"{CONFIG_ARGUMENTS['build_path']}/test1.html", 'r').read().find('ALTERNATIVE TEMPLATE') != -1
+
+    website.posts[test1_filepath].metadata['template'] = True
+    website.build()
+    assert website.pages_built == 4
+    assert open(f"{CONFIG_ARGUMENTS['build_path']}/test1.html", 'r').read().find('ALTERNATIVE TEMPLATE') == -1
+
+    del website.posts[test1_filepath].metadata['template']
+
     #
     # Test: SCSS is processed
     #
@@ -165,6 +209,14 @@ def test_build_with_scss():
     assert report
     assert report['build_start'] < report['build_end']
 
+    # Errors are dated in the report
+    website.errors.append((time.monotonic(), 'Test error'))
+    report = website.get_build_report()
+    error_date, error_message = report['errors'][-1]
+    assert error_message == 'Test error'
+    assert report['build_start'] < error_date <= datetime.datetime.now()
+    website.errors.pop()
+
     #
     # Test: The "data in build" option works, making shared data available as JSON in the build folder.
     #
@@ -194,3 +246,328 @@ def test_build_with_scss():
 
     # scss_off_test.css should now exist in current build
     assert os.path.exists(f"{CONFIG_ARGUMENTS['build_path']}/css/scss_off_test.css")
+
+    #
+    # Test: Pages can be rendered by a pool of threads when "build_in_threads" option is True
+    #
+    os.remove(f"{CONFIG_ARGUMENTS['build_path']}/test1.html")
+    os.remove(f"{CONFIG_ARGUMENTS['build_path']}/subfolder/subsubfolder/test4.html")
+
+    website.config.build_in_threads = True
+    website.build()
+
+    assert website.pages_built == 4
+    assert os.path.exists(f"{CONFIG_ARGUMENTS['build_path']}/test1.html")
+    assert os.path.exists(f"{CONFIG_ARGUMENTS['build_path']}/subfolder/subsubfolder/test4.html")
+
+    #
+    # Test: Only pages whose sources changed are rebuilt when "incremental_build" option is True
+    #
+    website.config.incremental_build = True
+    website.build()
+
+    assert website.pages_built == 0
+    assert website.pages_unchanged == 4
+    assert website.get_build_report()['pages_unchanged'] == 4
+
+    # Editing a content file only rebuilds its page
+    os.utime(f"{website.config.content_path}/test1.json.md")
+    website.build()
+
+    assert website.pages_built == 1
+    assert website.pages_unchanged == 3
+
+    # Editing a content file after Snek was instantiated: the page is rebuilt from the edited file, on the same instance.
+    # The next instances don't rebuild it.
+    test1_filepath = f"{website.config.content_path}/test1.json.md"
+    test1_source = open(test1_filepath, 'r').read()
+    test1_stat = os.stat(test1_filepath)
+    test1_html_filepath = f"{CONFIG_ARGUMENTS['build_path']}/test1.html"
+
+    try:
+        with open(test1_filepath, 'w') as test1_file:
+            test1_file.write(test1_source.replace('Content Level 1 test.', 'Edited on disk.'))
+        os.utime(test1_filepath, (0, time.time() + 60)) # Later than the last build, whatever the clock resolution
+
+        website.build()
+        assert website.pages_built == 1
+        assert open(test1_html_filepath, 'r').read().find('Edited on disk.') != -1
+
+        os.utime(test1_html_filepath, (0, time.time() + 120)) # Later than the edit
+
+        other_website = Snek(config)
+        other_website.build()
+        assert other_website.pages_built == 0
+        assert other_website.pages_unchanged == 4
+        assert open(test1_html_filepath, 'r').read().find('Edited on disk.') != -1
+    finally:
+        with open(test1_filepath, 'w') as test1_file:
+            test1_file.write(test1_source)
+        os.utime(test1_filepath, (test1_stat.st_atime, test1_stat.st_mtime))
+        os.utime(test1_html_filepath, (0, 0)) # Older than the restored file
+
+    website.build()
+    assert website.pages_built == 1
+    assert open(test1_html_filepath, 'r').read().find('Edited on disk.') == -1
+
+    # Editing a template or a data file after Snek was instantiated rebuilds every page, on the same instance
+    os.utime(f"{website.config.templates_path}/index.html")
+    website.build()
+    assert website.pages_built == 4
+
+    os.utime(f"{website.config.data_path}/test1.json")
+    website.build()
+    assert website.pages_built == 4
+
+    # Adding or removing a data file rebuilds every page, even if it is not the most recently edited one.
+    # Its removal is noticed by the next instances, and by the same instance which loads data again.
+    extra_filepath = f"{website.config.data_path}/extra.json"
+
+    try:
+        with open(extra_filepath, 'w') as extra_file:
+            extra_file.write('{"extra-key": "extra-value"}')
+        os.utime(extra_filepath, (0, 0)) # Older than every other data file
+
+        website.build()
+        assert website.data['extra'] == {'extra-key': 'extra-value'}
+        assert website.pages_built == 4
+    finally:
+        os.remove(extra_filepath)
+
+    other_website = Snek(config)
+    other_website.build()
+    assert 'extra' not in other_website.data
+    assert other_website.pages_built == 4
+
+    website.build()
+    assert 'extra' not in website.data
+    assert website.pages_built == 0
+
+    # Unchanged static files are not copied again
+    built_asset = f"{CONFIG_ARGUMENTS['build_path']}/assets/tux.svg"
+    os.utime(built_asset, (0, time.time() + 60)) # Later than its source: would be replaced if copied
+    built_asset_mtime = os.path.getmtime(built_asset)
+    website.build()
+
+    assert os.path.getmtime(built_asset) == built_asset_mtime
+
+    website.config.incremental_build = False
+
+def test_build_with_templates_sharing_cache(tmp_path):
+    """
+    Test building with two templates folders that share the same cache folder.
+
+    Success conditions
+    ------------------
+    - Each templates folder is rendered with its own compiled templates
+    """
+    cache_path = str(tmp_path / 'cache')
+
+    for theme in ['theme_a', 'theme_b']:
+        templates_path = tmp_path / theme
+        copytree(CONFIG_ARGUMENTS['templates_path'], templates_path)
+
+        index_filepath = templates_path / 'index.html'
+        index_filepath.write_text(index_filepath.read_text().replace('<head>', f'<head><!-- {theme} -->'))
+        os.utime(index_filepath, (0, 0)) # Older than any compiled template: would not be compiled again if shared
+
+        config_arguments = dict(CONFIG_ARGUMENTS,
+                                build_path=str(tmp_path / f'build_{theme}'),
+                                templates_path=str(templates_path),
+                                cache_path=cache_path)
+        website = Snek(SnekConfig(**config_arguments))
+        website.build()
+
+        assert open(f"{config_arguments['build_path']}/test1.html", 'r').read().find(f'<!-- {theme} -->') != -1
+
+def test_build_with_template_rewritten(tmp_path):
+    """
+    Test building again after a template was rewritten within the same second, with and without a cache folder.
+
+    Success conditions
+    ------------------
+    - The new version of the template is used
+    - No cache folder is created unless one is given
+    """
+    for cache_path in [None, str(tmp_path / 'cache')]:
+        templates_path = tmp_path / f'templates_{cache_path is None}'
+        copytree(CONFIG_ARGUMENTS['templates_path'], templates_path)
+
+        index_filepath = templates_path / 'index.html'
+        index_template = index_filepath.read_text()
+
+        config_arguments = dict(CONFIG_ARGUMENTS,
+                                build_path=str(tmp_path / 'build'),
+                                templates_path=str(templates_path),
+                                cache_path=cache_path)
+
+        for version in ['version_a', 'version_b']:
+            # Same size and modification time for both versions
+            index_filepath.write_text(index_template.replace('<head>', f'<head><!-- {version} -->'))
+            os.utime(index_filepath, (0, 0))
+
+            website = Snek(SnekConfig(**config_arguments))
+            website.build()
+
+            assert open(f"{config_arguments['build_path']}/test1.html", 'r').read().find(f'<!-- {version} -->') != -1
+
+    assert sorted(os.listdir(tmp_path)) == ['build', 'cache', 'templates_False', 'templates_True']
+
+def test_build_with_template_error(tmp_path):
+    """
+    Test building with a template that does not compile.
+
+    Success conditions
+    ------------------
+    - Pages using this template are skipped and the template error is reported, by processes as well as threads
+    - Other pages are built
+    """
+    templates_path = tmp_path / 'templates'
+    copytree(CONFIG_ARGUMENTS['templates_path'], templates_path)
+    (templates_path / 'alternate.html').write_text('% for item in []:\n${item}\n') # Unterminated "for"
+
+    config_arguments = dict(CONFIG_ARGUMENTS,
+                            build_path=str(tmp_path / 'build'),
+                            templates_path=str(templates_path),
+                            cache_path=str(tmp_path / 'cache'))
+
+    for build_in_threads in [False, True]:
+        config_arguments['build_in_threads'] = build_in_threads
+        website = Snek(SnekConfig(**config_arguments))
+        website.build()
+
+        assert website.pages_built == 3
+        assert website.pages_skipped == 1
+        assert website.errors[-1][1].find('test2.json.md could not be built') != -1
+        assert website.errors[-1][1].find('Unterminated control keyword') != -1
+
+def test_load_lenient_json(tmp_path):
+    """
+    Test loading data files and front matter that only the standard library's JSON parser accepts.
+
+    Success conditions
+    ------------------
+    - NaN and integers beyond 64 bits are accepted, whether orjson is installed or not
+    """
+    data_path = tmp_path / 'data'
+    data_path.mkdir()
+    (data_path / 'lenient.json').write_text('{"nan": NaN, "big": 123456789012345678901234567890}')
+
+    content_path = tmp_path / 'content'
+    content_path.mkdir()
+    (content_path / 'lenient.json.md').write_text('{\n"title": "Lenient", "big": 123456789012345678901234567890\n}\n\nLenient.')
+
+    config_arguments = dict(CONFIG_ARGUMENTS,
+                            build_path=str(tmp_path / 'build'),
+                            data_path=str(data_path),
+                            content_path=str(content_path))
+    website = Snek(SnekConfig(**config_arguments))
+
+    assert not website.errors
+    assert website.data['lenient']['big'] == 123456789012345678901234567890
+    assert website.sitemap['lenient']['big'] == 123456789012345678901234567890
+
+def test_load_conflicting_paths(tmp_path):
+    """
+    Test loading data and content files whose place in the data tree or the sitemap is already taken.
+
+    Success conditions
+    ------------------
+    - A data file below a data file that is not a dict is reported, and the tree is left untouched
+    - A data file or content file whose key is already used is reported, and the tree is left untouched
+    """
+    data_path = tmp_path / 'data'
+    (data_path / 'list').mkdir(parents=True)
+    (data_path / 'test1.json').write_text('{"test-key": "Used by the index.html template"}')
+    (data_path / 'list.json').write_text('[1, 2]')
+    (data_path / 'list' / 'item.json').write_text('{"test-key": "Lorem Ipsum"}')
+    (data_path / 'dict').mkdir()
+    (data_path / 'dict.json').write_text('{"item": "From dict.json"}')
+    (data_path / 'dict' / 'item.json').write_text('{"test-key": "Lorem Ipsum"}')
+
+    content_path = tmp_path / 'content'
+    (content_path / 'page').mkdir(parents=True)
+    (content_path / 'page.json.md').write_text('{\n"title": "Page", "subpage": "From page.json.md"\n}\n\nPage.')
+    (content_path / 'page' / 'subpage.json.md').write_text('{\n"title": "Subpage"\n}\n\nSubpage.')
+
+    config_arguments = dict(CONFIG_ARGUMENTS,
+                            build_path=str(tmp_path / 'build'),
+                            data_path=str(data_path),
+                            content_path=str(content_path))
+    website = Snek(SnekConfig(**config_arguments))
+    errors = [message for moment, message in website.errors]
+
+    assert website.data['list'] == [1, 2]
+    assert website.data['dict'] == {'item': 'From dict.json'}
+    assert f"{data_path}/list/item.json was not added to data: its path is already used by another data file." in errors
+    assert f"{data_path}/dict/item.json was not added to data: its path is already used by another data file." in errors
+
+    assert website.sitemap['page']['subpage'] == 'From page.json.md'
+    assert f"{content_path}/page/subpage.json.md was not added to the sitemap: its path is already used by another content file." in errors
+
+    # Pages are built even if they are not in the sitemap
+    website.build()
+    assert website.pages_built == 2
+
+def test_load_files_as_folders(tmp_path):
+    """
+    Test loading data and content from paths that are files, not folders.
+
+    Success conditions
+    ------------------
+    - Snek is instantiated, with no data and an empty sitemap
+    """
+    not_a_folder = tmp_path / 'not_a_folder'
+    not_a_folder.write_text('')
+
+    config_arguments = dict(CONFIG_ARGUMENTS,
+                            build_path=str(tmp_path / 'build'),
+                            data_path=str(not_a_folder),
+                            content_path=str(not_a_folder))
+    website = Snek(SnekConfig(**config_arguments))
+
+    assert website.data == {}
+    assert website.sitemap == {}
+    assert website.sitemap_flat == []
+
+@pytest.mark.skipif(not hasattr(os, 'geteuid') or os.geteuid() == 0, reason="File permissions are not enforced for root or outside POSIX")
+def test_build_with_unreadable_files(tmp_path):
+    """
+    Test loading and building with files Snek is not allowed to read or write.
+
+    Success conditions
+    ------------------
+    - Unreadable data and content files are reported, and their pages skipped
+    - Pages that cannot be written are reported and skipped
+    - Other pages are built
+    """
+    data_path = tmp_path / 'data'
+    copytree(CONFIG_ARGUMENTS['data_path'], data_path)
+    (data_path / 'unreadable.json').write_text('{}')
+    (data_path / 'unreadable.json').chmod(0)
+
+    content_path = tmp_path / 'content'
+    copytree(CONFIG_ARGUMENTS['content_path'], content_path)
+    (content_path / 'unreadable.json.md').write_text('{\n"title": "Unreadable"\n}\n\nUnreadable.')
+    (content_path / 'unreadable.json.md').chmod(0)
+
+    build_path = tmp_path / 'build'
+    build_path.mkdir()
+    (build_path / 'test1.html').write_text('')
+    (build_path / 'test1.html').chmod(0)
+
+    config_arguments = dict(CONFIG_ARGUMENTS,
+                            build_path=str(build_path),
+                            data_path=str(data_path),
+                            content_path=str(content_path),
+                            cache_path=str(tmp_path / 'cache'))
+    website = Snek(SnekConfig(**config_arguments))
+    website.build()
+    errors = [message for moment, message in website.errors]
+
+    assert f"{data_path}/unreadable.json cannot be read." in errors
+    assert f"{content_path}/unreadable.json.md cannot be read." in errors
+    assert [message for message in errors if message.startswith(f"{content_path}/test1.json.md could not be built.")]
+
+    assert website.pages_built == 3
+    assert website.pages_skipped == 2
@@ -30,6 +30,7 @@ def test_construct_invalid_arguments():
         {'assets_path': 12},
         {'css_path': 12},
         {'scss_path': 12},
+        {'cache_path': 12},
         {'content_path': f"./{uuid.uuid4()}"},
         {'data_path': f"./{uuid.uuid4()}"},
         {'templates_path': f"./{uuid.uuid4()}"},
@@ -67,6 +68,11 @@ def test_construct_valid_arguments():
         css_path=f'{MOCKS_FOLDER}/css',
         scss_active=True,
         scss_path=f'{MOCKS_FOLDER}/scss',
-        scss_output_style='compressed'
+        scss_output_style='compressed',
+        markdown_extensions=['tables'],
+        cache_path=f'{MOCKS_FOLDER}/cache',
+        build_in_threads=False,
+        build_workers=2,
+        incremental_build=False
     )
     assert config